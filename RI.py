@@ -1,10 +1,16 @@
 import os
 import math
 import json
-from collections import deque
+import functools
+import threading
+import numpy as np
 from compact_trie import CompactTrie 
+from json_io import load_json
 
-# Define a precedência dos operadores para o Shunting-Yard
+# Lista de postings vazia (termo ausente na Trie)
+EMPTY_POSTINGS = np.empty(0, dtype=np.uint32)
+
+# Operadores da consulta e sua precedência (AND liga mais forte que OR)
 OP_PRECEDENCE = {
     'OR': 1,
     'AND': 2,
@@ -12,17 +18,45 @@ OP_PRECEDENCE = {
     ')': 0
 }
 
+# Aninhamento máximo de parênteses na consulta: o parser é recursivo (~3 chamadas
+# por nível), então o limite mantém a pilha do Python longe do RecursionError
+MAX_QUERY_DEPTH = 100
+
+@functools.lru_cache(maxsize=256)
+def tokenize_query(query: str) -> tuple:
+    """
+    Quebra a string da consulta em tokens (termos e operadores).
+    Em cache por consulta: a paginação repete a mesma string várias vezes.
+    """
+    query = query.replace('(', ' ( ').replace(')', ' ) ')
+    
+    processed_tokens = []
+    for token in query.split():
+        if token in OP_PRECEDENCE:
+            processed_tokens.append(token) # Operadores (AND, OR, () )
+        else:
+            processed_tokens.append(token.lower()) # Termos
+    return tuple(processed_tokens)
+
 class InformationRetriever:
     """
     Processa consultas booleanas e ranqueia os resultados por Z-score.
     """
-    def __init__(self, trie_file="inverted_index.txt", stats_file="global_stats.json"):
+    def __init__(self, trie_file="inverted_index.trie", stats_file="global_stats.json", forward_file="forward_index.npz"):
         self.trie = CompactTrie()
         self.global_stats = {}
         self.is_ready = False # Flag que indica se os dados carregaram
+        # Memo de trie.find() válido durante a consulta corrente; um por thread,
+        # já que o mesmo retriever atende todas as requisições do Flask
+        self._local = threading.local()
+        # Índice direto (opcional): termo -> term_id e chaves (DocID, term_id) ordenadas
+        self._term_ids = None
+        self._forward_keys = None
+        self._forward_tfs = None
 
         if self._load_data(trie_file, stats_file):
             self.is_ready = True
+            self._load_forward_index(forward_file)
         
     def _load_data(self, trie_file, stats_file):
         """Carrega a Trie (índice) e as estatísticas (Z-score) do disco."""
@@ -32,87 +66,236 @@ class InformationRetriever:
             return False
             
         try:
-            with open(stats_file, 'r', encoding='utf-8') as f:
-                self.global_stats = json.load(f)
+            self.global_stats = load_json(stats_file)
             return True
         except (FileNotFoundError, json.JSONDecodeError):
             print(f"ERRO: Falha ao carregar as estatísticas de Z-score do arquivo {stats_file}.")
             return False
 
+    def _load_forward_index(self, forward_file):
+        """
+        Carrega o índice direto (CSR DocID -> [(term_id, tf)]) gerado pelo indexador.
+        Sem ele, o ranqueamento usa as postings da Trie.
+        """
+        try:
+            with np.load(forward_file) as data:
+                doc_ptr, term_ids, tfs, terms = data['doc_ptr'], data['term_ids'], data['tfs'], data['terms']
+        except (FileNotFoundError, KeyError, ValueError):
+            print(f"AVISO: Índice direto {forward_file} não encontrado. O ranqueamento usará a Trie.")
+            return
+        
+        self._term_ids = {term: i for i, term in enumerate(terms.tolist())}
+        # Chave única DocID * num_termos + term_id: já sai ordenada, pois os term_ids
+        # de cada doc estão em ordem crescente e as linhas seguem a ordem dos DocIDs
+        self._num_terms = np.uint64(len(terms))
+        doc_rows = np.repeat(np.arange(len(doc_ptr) - 1, dtype=np.uint64), np.diff(doc_ptr).astype(np.int64))
+        self._forward_keys = doc_rows * self._num_terms + term_ids
+        self._forward_tfs = tfs
+
+    def _cached_find(self, term: str):
+        """Busca o termo na Trie, resolvendo cada termo no máximo uma vez por consulta."""
+        cache = getattr(self._local, 'find_cache', None)
+        if cache is None:
+            cache = self._local.find_cache = {}
+        if term in cache:
+            return cache[term]
+        node = cache[term] = self.trie.find(term)
+        return node
+
     # ====================================================================
-    # LÓGICA BOOLEANA (SHUNTING-YARD E AVALIAÇÃO RPN)
+    # LÓGICA BOOLEANA (PARSER DESCENDENTE RECURSIVO -> ÁRVORE -> AVALIAÇÃO)
     # ====================================================================
 
-    def _tokenize_query(self, query: str) -> list:
-        """Quebra a string da consulta em tokens (termos e operadores)."""
-        query = query.replace('(', ' ( ').replace(')', ' ) ')
-        tokens = query.split()
+    def _tokenize_query(self, query: str) -> tuple:
+        """Tokens da consulta (tupla imutável, compartilhada pelo cache de tokenize_query)."""
+        return tokenize_query(query)
+
+    def _parse_and_eval(self, tokens: list) -> np.ndarray:
+        """
+        Monta a árvore da consulta (descida recursiva), avalia e retorna o
+        array ordenado de DocIDs.
+        Gramática: or := and ('OR' and)* | and := atom ('AND' atom)* | atom := termo | '(' or ')'
+        Nós da árvore: ('TERM', termo) | ('AND', filhos) | ('OR', filhos)
+        """
+        tokens = self._drop_unmatched_parens(tokens)
+        if self._max_depth(tokens) > MAX_QUERY_DEPTH:
+            raise ValueError("Consulta Booleana inválida.")
+        tree, pos = self._parse_or(tokens, 0)
         
-        processed_tokens = []
-        for token in tokens:
-            if token.strip():
-                if token in OP_PRECEDENCE:
-                    processed_tokens.append(token) # Operadores (AND, OR, () )
-                else:
-                    processed_tokens.append(token.lower()) # Termos
-        return processed_tokens
+        if pos != len(tokens):
+            raise ValueError("Consulta Booleana inválida.")
+            
+        return self._as_doc_ids(self._eval_tree(tree))
+
+    def _is_conjunction(self, tokens: list) -> bool:
+        """Verifica se a consulta é da forma "termo AND termo AND ..." (sem OR nem parênteses)."""
+        return (len(tokens) % 2 == 1
+                and all(token not in OP_PRECEDENCE for token in tokens[0::2])
+                and all(token == 'AND' for token in tokens[1::2]))
 
-    def _to_rpn(self, tokens: list) -> list:
-        """Converte tokens para Notação Polonesa Reversa (RPN) via Shunting-Yard."""
-        output = []
-        operator_stack = deque()
+    def _drop_unmatched_parens(self, tokens: list) -> list:
+        """Remove parênteses sem par, que a consulta tolera (ex: "(carro" ou "carro)")."""
+        unmatched = set()
+        open_positions = []
+        for i, token in enumerate(tokens):
+            if token == '(':
+                open_positions.append(i)
+            elif token == ')':
+                if open_positions:
+                    open_positions.pop()
+                else:
+                    unmatched.add(i)
+        unmatched.update(open_positions)
+        
+        if not unmatched:
+            return tokens
+        return [token for i, token in enumerate(tokens) if i not in unmatched]
 
+    @staticmethod
+    def _max_depth(tokens: list) -> int:
+        """Maior nível de aninhamento de parênteses (já balanceados) da consulta."""
+        depth = max_depth = 0
         for token in tokens:
-            if token not in OP_PRECEDENCE:
-                output.append(token) # Termo
-            elif token == '(':
-                operator_stack.append(token)
+            if token == '(':
+                depth += 1
+                max_depth = max(max_depth, depth)
             elif token == ')':
-                while operator_stack and operator_stack[-1] != '(':
-                    output.append(operator_stack.pop())
-                if operator_stack and operator_stack[-1] == '(':
-                    operator_stack.pop() # Descarta o '('
-            else:
-                # Operador (AND ou OR)
-                while (operator_stack and operator_stack[-1] != '(' and 
-                       OP_PRECEDENCE.get(operator_stack[-1], 0) >= OP_PRECEDENCE[token]):
-                    output.append(operator_stack.pop())
-                operator_stack.append(token)
-
-        while operator_stack:
-            output.append(operator_stack.pop())
-            
-        return output
-
-    def _evaluate_rpn(self, rpn_tokens: list) -> set:
-        """Avalia a consulta RPN e retorna o conjunto de DocIDs."""
-        operand_stack = deque()
-
-        for token in rpn_tokens:
-            if token not in OP_PRECEDENCE:
-                # É um termo: busca os DocIDs na Trie
-                index_list = self.trie.find(token)
-                doc_ids = {doc_id for doc_id, tf in index_list}
-                operand_stack.append(doc_ids)
-            
-            elif token == 'AND':
-                # Interseção
-                if len(operand_stack) < 2: raise ValueError("Consulta AND mal formada.")
-                set2 = operand_stack.pop()
-                set1 = operand_stack.pop()
-                operand_stack.append(set1.intersection(set2))
+                depth -= 1
+        return max_depth
+
+    # Os operandos são arrays ordenados de DocIDs ou, para termos densos, bitmaps
+    # (np.bool_, posição = DocID); as operações escolhem o caminho pelo par de tipos.
+
+    @staticmethod
+    def _is_bitmap(operand: np.ndarray) -> bool:
+        return operand.dtype == np.bool_
+
+    def _as_doc_ids(self, operand: np.ndarray) -> np.ndarray:
+        """Converte o operando em array ordenado de DocIDs (uint32)."""
+        if self._is_bitmap(operand):
+            return np.flatnonzero(operand).astype(np.uint32)
+        return operand
+
+    def _is_empty(self, operand: np.ndarray) -> bool:
+        return not operand.any() if self._is_bitmap(operand) else operand.size == 0
+
+    def _intersect(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Interseção: bitmap & bitmap, sondagem do array no bitmap, ou merge de arrays."""
+        a_bitmap, b_bitmap = self._is_bitmap(a), self._is_bitmap(b)
+        if a_bitmap and b_bitmap:
+            return a & b
+        if a_bitmap:
+            return b[a[b]]
+        if b_bitmap:
+            return a[b[a]]
+        return np.intersect1d(a, b, assume_unique=True)
+
+    def _union(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """União: bitmap | bitmap, marcação do array numa cópia do bitmap, ou merge de arrays."""
+        a_bitmap, b_bitmap = self._is_bitmap(a), self._is_bitmap(b)
+        if a_bitmap and b_bitmap:
+            return a | b
+        if a_bitmap or b_bitmap:
+            bitmap, doc_ids = (a, b) if a_bitmap else (b, a)
+            bitmap = bitmap.copy()
+            bitmap[doc_ids] = True
+            return bitmap
+        return np.union1d(a, b)
+
+    def _parse_or(self, tokens: list, pos: int):
+        """Lê uma sequência de ANDs unidos por OR. Retorna (árvore, pos)."""
+        tree, pos = self._parse_and(tokens, pos)
+        children = [tree]
+        
+        while pos < len(tokens) and tokens[pos] == 'OR':
+            if pos + 1 == len(tokens): raise ValueError("Consulta OR mal formada.")
+            tree, pos = self._parse_and(tokens, pos + 1)
+            children.append(tree)
                 
-            elif token == 'OR':
-                # União
-                if len(operand_stack) < 2: raise ValueError("Consulta OR mal formada.")
-                set2 = operand_stack.pop()
-                set1 = operand_stack.pop()
-                operand_stack.append(set1.union(set2))
-
-        if len(operand_stack) != 1:
+        return self._make_node('OR', children), pos
+
+    def _parse_and(self, tokens: list, pos: int):
+        """Lê uma sequência de átomos ligados por AND. Retorna (árvore, pos)."""
+        tree, pos = self._parse_atom(tokens, pos)
+        children = [tree]
+        
+        while pos < len(tokens) and tokens[pos] == 'AND':
+            if pos + 1 == len(tokens): raise ValueError("Consulta AND mal formada.")
+            tree, pos = self._parse_atom(tokens, pos + 1)
+            children.append(tree)
+                
+        return self._make_node('AND', children), pos
+
+    def _parse_atom(self, tokens: list, pos: int):
+        """Lê um termo ou uma subexpressão entre parênteses. Retorna (árvore, pos)."""
+        if pos == len(tokens):
             raise ValueError("Consulta Booleana inválida.")
             
-        return operand_stack.pop()
+        token = tokens[pos]
+        
+        if token == '(':
+            tree, pos = self._parse_or(tokens, pos + 1)
+            if pos == len(tokens) or tokens[pos] != ')':
+                raise ValueError("Consulta Booleana inválida.")
+            return tree, pos + 1 # Descarta o ')'
+
+            
+        if token in OP_PRECEDENCE:
+            raise ValueError(f"Consulta {token} mal formada." if token in ('AND', 'OR') else "Consulta Booleana inválida.")
+            
+        return ('TERM', token), pos + 1
+
+    @staticmethod
+    def _make_node(op: str, children: list) -> tuple:
+        """
+        Cria o nó op(filhos) já simplificado: filhos com o mesmo operador são achatados
+        (a AND (b AND c) -> a AND b AND c) e subárvores repetidas aparecem uma só vez.
+        """
+        flat = []
+        for child in children:
+            if child[0] == op:
+                flat.extend(child[1])
+            else:
+                flat.append(child)
+        
+        flat = tuple(dict.fromkeys(flat))
+        return flat[0] if len(flat) == 1 else (op, flat)
+
+    def _estimate_size(self, tree: tuple) -> int:
+        """Limite superior de DocIDs da subárvore, usando só o tamanho das postings."""
+        op, arg = tree
+        if op == 'TERM':
+            node = self._cached_find(arg)
+            return node.num_postings if node else 0
+        
+        sizes = [self._estimate_size(child) for child in arg]
+        return min(sizes) if op == 'AND' else sum(sizes)
+
+    def _eval_tree(self, tree: tuple) -> np.ndarray:
+        """Avalia a árvore de baixo para cima. Retorna o operando (array de DocIDs ou bitmap)."""
+        op, arg = tree
+        
+        if op == 'TERM':
+            # Bitmap se o termo for denso; senão os DocIDs (já ordenados) do nó da Trie
+            node = self._cached_find(arg)
+            if node is None:
+                return EMPTY_POSTINGS
+            return node.bitmap if node.bitmap is not None else node.doc_ids
+        
+        if op == 'OR':
+            result = self._eval_tree(arg[0])
+            for child in arg[1:]:
+                result = self._union(result, self._eval_tree(child))
+            return result
+        
+        # AND: do filho de menor cardinalidade para o maior, parando no primeiro vazio
+        children = sorted(arg, key=self._estimate_size)
+        result = self._eval_tree(children[0])
+        for child in children[1:]:
+            if self._is_empty(result):
+                break
+            result = self._intersect(result, self._eval_tree(child))
+        return result
 
     # ====================================================================
     # RANQUEAMENTO POR Z-SCORE
@@ -132,54 +315,170 @@ class InformationRetriever:
         
         return (tf - mu) / sigma
 
-    def _rank_results(self, doc_ids: set, query_terms: set) -> list:
-        """Calcula a relevância (média dos Z-scores) e ordena os DocIDs."""
-        ranked_docs = [] # Lista de (relevância, doc_id)
+    def _calculate_z_scores(self, tfs: np.ndarray, term: str) -> np.ndarray:
+        """Versão vetorizada de _calculate_z_score para um array de TFs do mesmo termo."""
+        stats = self.global_stats.get(term)
+        if not stats:
+            return np.zeros(len(tfs))
+        
+        mu = stats['mu']
+        sigma = stats['sigma']
+        
+        if sigma <= 0:
+            return np.where(tfs > mu, 1.0, 0.0)
+        
+        return (tfs - mu) / sigma
+
+    def _rank_results(self, doc_ids: np.ndarray, query_terms: set) -> list:
+        """
+        Calcula a relevância (média dos Z-scores) e ordena os DocIDs (array ordenado).
+        Retorna [(doc_id, termo_mais_relevante, tf_do_termo)], do mais ao menos relevante.
+        """
+        candidates = doc_ids
+        terms = list(query_terms)
+        
+        total_z_score = np.zeros(len(candidates))
+        term_count = np.zeros(len(candidates), dtype=np.int32)
+        # Termo de maior Z-score por doc (usado no snippet)
+        best_z_score = np.full(len(candidates), -np.inf)
+        best_term_idx = np.zeros(len(candidates), dtype=np.int32)
+        best_tf = np.zeros(len(candidates), dtype=np.uint32)
+
+        for term_idx, term in enumerate(terms):
+            # 1+2. TFs do termo nos candidatos (posições em `candidates` + TFs)
+            positions, tfs = self._candidate_tfs(term, candidates)
+            if positions.size == 0:
+                continue
+            
+            # 3. Z-scores de todos esses docs de uma vez
+            z_scores = self._calculate_z_scores(tfs, term)
+            np.add.at(total_z_score, positions, z_scores)
+            np.add.at(term_count, positions, 1)
+
+            # Atualiza o termo mais relevante onde este termo supera o anterior
+            improved = z_scores > best_z_score[positions]
+            best_z_score[positions[improved]] = z_scores[improved]
+            best_term_idx[positions[improved]] = term_idx
+            best_tf[positions[improved]] = tfs[improved]
+
+        # 4. Relevância = Média dos Z-scores (só docs com algum termo)
+        has_terms = term_count > 0
+        relevance = total_z_score[has_terms] / term_count[has_terms]
+
+        return self._sort_by_relevance(candidates[has_terms], relevance, terms,
+                                       best_term_idx[has_terms], best_tf[has_terms])
 
-        for doc_id in doc_ids:
-            total_z_score = 0.0
-            term_count = 0
+    def _candidate_tfs(self, term: str, candidates: np.ndarray):
+        """
+        Acha os candidatos que contêm o termo e seus TFs. Retorna (posições em candidates, tfs).
+        Com o índice direto é só uma busca binária nas chaves (DocID, term_id);
+        senão, filtra as postings do nó da Trie.
+        """
+        if self._forward_keys is not None:
+            term_id = self._term_ids.get(term)
+            if term_id is None or self._forward_keys.size == 0:
+                return EMPTY_POSTINGS, EMPTY_POSTINGS
+            keys = candidates.astype(np.uint64) * self._num_terms + np.uint64(term_id)
+            positions = np.searchsorted(self._forward_keys, keys)
+            np.minimum(positions, self._forward_keys.size - 1, out=positions)
+            hits = self._forward_keys[positions] == keys
+            return np.flatnonzero(hits), self._forward_tfs[positions[hits]]
+        
+        node = self._cached_find(term)
+        if node is None:
+            return EMPTY_POSTINGS, EMPTY_POSTINGS
+        
+        # Seleciona as postings do termo que estão entre os candidatos
+        mask = np.isin(node.doc_ids, candidates, assume_unique=True)
+        return np.searchsorted(candidates, node.doc_ids[mask]), node.tfs[mask]
+
+    def _rank_conjunction(self, terms: list) -> list:
+        """
+        Avalia e ranqueia uma consulta só com AND documento a documento (DAAT):
+        a menor lista de postings conduz e as demais são sondadas via searchsorted,
+        que testa a pertinência e já devolve o TF do termo.
+        Retorna o mesmo formato de _rank_results.
+        """
+        nodes = [self._cached_find(term) for term in terms]
+        if any(node is None for node in nodes):
+            return []
+        
+        # Visita os termos da menor para a maior lista de postings
+        visit_order = sorted(range(len(terms)), key=lambda i: nodes[i].num_postings)
+        lead = nodes[visit_order[0]]
+        candidates = lead.doc_ids
+        tf_columns = {visit_order[0]: lead.tfs}
+        
+        for i in visit_order[1:]:
+            doc_ids = nodes[i].doc_ids
+            positions = np.searchsorted(doc_ids, candidates)
+            np.minimum(positions, len(doc_ids) - 1, out=positions)
+            hits = doc_ids[positions] == candidates
             
-            for term in query_terms:
-                # 1. Acha o TF do termo neste doc
-                index_list = self.trie.find(term)
-                tf = next((t for d, t in index_list if d == doc_id), 0)
-                
-                if tf > 0:
-                    # 2. Calcula o Z-score
-                    z_score = self._calculate_z_score(tf, term)
-                    total_z_score += z_score
-                    term_count += 1
+            candidates = candidates[hits]
+            for j in tf_columns:
+                tf_columns[j] = tf_columns[j][hits]
+            tf_columns[i] = nodes[i].tfs[positions[hits]]
             
-            if term_count > 0:
-                # 3. Relevância = Média dos Z-scores
-                relevance = total_z_score / term_count
-                ranked_docs.append((relevance, doc_id))
+            if candidates.size == 0:
+                return []
+        
+        # Todos os candidatos têm todos os termos: relevância = soma dos Z-scores / K
+        total_z_score = np.zeros(len(candidates))
+        best_z_score = np.full(len(candidates), -np.inf)
+        best_term_idx = np.zeros(len(candidates), dtype=np.int32)
+        best_tf = np.zeros(len(candidates), dtype=np.uint32)
+        
+        for term_idx, term in enumerate(terms):
+            tfs = tf_columns[term_idx]
+            z_scores = self._calculate_z_scores(tfs, term)
+            total_z_score += z_scores
+            
+            improved = z_scores > best_z_score
+            best_z_score[improved] = z_scores[improved]
+            best_term_idx[improved] = term_idx
+            best_tf[improved] = tfs[improved]
+        
+        relevance = total_z_score / len(terms)
+        return self._sort_by_relevance(candidates, relevance, terms, best_term_idx, best_tf)
 
-        # Ordena pela relevância (maior primeiro)
-        ranked_docs.sort(key=lambda x: x[0], reverse=True)
+    def _sort_by_relevance(self, doc_ids, relevance, terms, best_term_idx, best_tf) -> list:
+        """Ordena pela relevância (maior primeiro), desempate pelo menor DocID."""
+        order = np.argsort(-relevance, kind='stable')
         
-        return [doc_id for relevance, doc_id in ranked_docs]
+        ranked_ids = doc_ids[order].tolist()
+        ranked_terms = best_term_idx[order].tolist()
+        ranked_tfs = best_tf[order].tolist()
+        return [(doc_id, terms[t], tf) for doc_id, t, tf in zip(ranked_ids, ranked_terms, ranked_tfs)]
 
     # ====================================================================
     # FUNÇÃO PRINCIPAL
     # ====================================================================
 
     def search(self, query: str) -> list:
-        """Executa a busca booleana e ranqueada."""
+        """
+        Executa a busca booleana e ranqueada.
+        Retorna [(doc_id, termo_mais_relevante, tf_do_termo)] ordenado por relevância.
+        """
         if not self.is_ready:
             return []
 
+        # Nova consulta: descarta o memo da anterior (desta thread)
+        self._local.find_cache = {}
+
         try:
             # 1. Processa a query
             tokens = self._tokenize_query(query)
             query_terms = {t for t in tokens if t not in OP_PRECEDENCE}
             
+            if self._is_conjunction(tokens):
+                # 2+3. Só ANDs: filtra e ranqueia numa única passada (DAAT)
+                return self._rank_conjunction(list(query_terms))
+            
             # 2. Filtro Booleano
-            rpn_tokens = self._to_rpn(tokens)
-            matching_doc_ids = self._evaluate_rpn(rpn_tokens)
+            matching_doc_ids = self._parse_and_eval(tokens)
             
-            if not matching_doc_ids:
+            if matching_doc_ids.size == 0:
                 return []
                 
             # 3. Ranqueamento
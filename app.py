@@ -1,113 +1,138 @@
 import os
-import json
 import re
-import string
+import functools
+import mmap
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, request
-from RI import InformationRetriever, OP_PRECEDENCE
+from RI import InformationRetriever
 from indexer import Indexer
+from json_io import load_json
+from compact_trie import postings_filename
 
 # --- CONFIGURAÇÃO ---
-TRIE_FILE = "inverted_index.txt"
+TRIE_FILE = "inverted_index.trie"
 STATS_FILE = "global_stats.json"
 MAP_FILE = "doc_id_map.json"
+TITLES_FILE = "titles.json"
+CORPUS_FILE = "corpus.bin"
+OFFSETS_FILE = "corpus_offsets.npy"
+FORWARD_FILE = "forward_index.npz"
+MANIFEST_FILE = "manifest.json"
 CORPUS_PATH = "bbc"
 RESULTS_PER_PAGE = 10
+SNIPPET_WORKERS = 8
+SNIPPET_SLACK = 2 # Candidatos extras por página, caso algum não gere snippet
 
 app = Flask(__name__)
 
+# Threads para gerar snippets em paralelo (a leitura dos arquivos libera o GIL)
+SNIPPET_POOL = ThreadPoolExecutor(max_workers=SNIPPET_WORKERS)
+
 # --- CARREGAMENTO DOS DADOS ---
 print("Carregando o módulo de Recuperação de Informação...")
-retriever = InformationRetriever(trie_file=TRIE_FILE, stats_file=STATS_FILE)
+retriever = InformationRetriever(trie_file=TRIE_FILE, stats_file=STATS_FILE, forward_file=FORWARD_FILE)
 print("Módulo carregado com sucesso.")
 
 print("Carregando o mapa de documentos...")
-doc_map = {}
+doc_map = [] # Caminho relativo de cada doc; posição = DocID - 1
 try:
-    with open(MAP_FILE, 'r', encoding='utf-8') as f:
-        doc_map_str_keys = json.load(f)
-        doc_map = {int(k): v for k, v in doc_map_str_keys.items()} # Converte chaves de str para int
+    doc_map = load_json(MAP_FILE)
     print("Mapa de documentos carregado.")
 except FileNotFoundError:
     print(f"AVISO: Arquivo de mapa '{MAP_FILE}' não encontrado. Será gerado se necessário.")
 except Exception as e:
     print(f"ERRO: Falha ao carregar o mapa de documentos: {e}")
 
+print("Carregando os títulos dos documentos...")
+doc_titles = [] # Título de cada doc; posição = DocID - 1
+try:
+    doc_titles = load_json(TITLES_FILE)
+    print("Títulos carregados.")
+except FileNotFoundError:
+    print(f"AVISO: Arquivo de títulos '{TITLES_FILE}' não encontrado. Será gerado se necessário.")
+except Exception as e:
+    print(f"ERRO: Falha ao carregar os títulos: {e}")
+
+print("Mapeando o corpus concatenado...")
+corpus_mm, corpus_offsets = None, None
+try:
+    corpus_offsets = np.load(OFFSETS_FILE)
+    with open(CORPUS_FILE, 'rb') as f:
+        corpus_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    print("Corpus mapeado.")
+except FileNotFoundError:
+    print(f"AVISO: Corpus '{CORPUS_FILE}' não encontrado. Os documentos serão lidos dos arquivos originais.")
+except Exception as e:
+    corpus_mm, corpus_offsets = None, None
+    print(f"ERRO: Falha ao mapear o corpus: {e}")
+
 
 # --- FUNÇÕES AUXILIARES ---
-def generate_snippet(doc_id, query_terms):
+def _doc_path(doc_id):
+    """Caminho relativo do documento, ou None se o DocID não existe."""
+    return doc_map[doc_id - 1] if 0 < doc_id <= len(doc_map) else None
+
+def _doc_title(doc_id):
+    """Título extraído na indexação, ou None se não estiver disponível."""
+    return doc_titles[doc_id - 1] if 0 < doc_id <= len(doc_titles) else None
+
+@functools.lru_cache(maxsize=1024)
+def _compile_term_regex(term):
     """
-    Gera um snippet (título, trecho) para um resultado de busca.
-    Retorna None se não conseguir gerar um snippet válido.
+    Compila (uma vez por termo) a regex que acha o termo isolado no texto, ou seja,
+    sem caracteres de token do indexador ([a-z0-9&-]) colados nele.
+    Casos especiais para 't e 'd (ex: don't, I'd): o apóstrofo também conta como colado.
     """
-    relative_path = doc_map.get(doc_id)
+    before = "'" if term == 't' else ""
+    after = "'" if term in ('t', 'd') else ""
+    return re.compile(rf"(?<![a-z0-9&\-{before}]){re.escape(term)}(?![a-z0-9&\-{after}])", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=2048)
+def _load_doc(doc_id):
+    """
+    Lê (título, corpo) de um documento, mantendo os mais recentes em cache.
+    Usa o corpus concatenado (mmap) se disponível; senão abre o arquivo original.
+    Retorna None se o DocID não existe; levanta FileNotFoundError se o arquivo sumiu.
+    """
+    relative_path = _doc_path(doc_id)
     if not relative_path: return None
     
+    if corpus_mm is not None and doc_id < len(corpus_offsets):
+        offset, length = (int(x) for x in corpus_offsets[doc_id])
+        title, _, body = corpus_mm[offset:offset + length].decode('utf-8', errors='ignore').partition('\n')
+        return title.strip(), body
+    
     full_path = os.path.join(CORPUS_PATH, relative_path)
+    with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
+        title = f.readline().strip()
+        body = f.read()
+    return title, body
+
+def generate_snippet(doc_id, most_relevant_term):
+    """
+    Gera um snippet (título, trecho) para um resultado de busca, centrado no
+    termo mais relevante (maior z-score) escolhido pelo ranqueamento.
+    Retorna None se não conseguir gerar um snippet válido.
+    """
+    # Títulos extraídos na indexação: doc sem título é descartado sem abrir o arquivo
+    if _doc_title(doc_id) == "": return None
     
     try:
-        with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-            title = f.readline().strip()
-            if not title: return None
-            content = title + "\n" + f.read()
+        doc = _load_doc(doc_id)
     except FileNotFoundError:
         return None
-
-    # Acha o termo da query mais relevante (maior z-score) neste doc
-    most_relevant_term = ""
-    highest_z_score = -float('inf')
-
-    for term in query_terms:
-        index_list = retriever.trie.find(term)
-        tf = next((t for d, t in index_list if d == doc_id), 0)
-        
-        if tf > 0:
-            z_score = retriever._calculate_z_score(tf, term)
-            if z_score > highest_z_score:
-                highest_z_score = z_score
-                most_relevant_term = term
+    if not doc: return None
+    
+    title, body = doc
+    if not title: return None
+    content = title + "\n" + body
 
     if not most_relevant_term: return None
 
     # --- Lógica para encontrar o termo no texto ---
     best_match = None
-    regex_pattern = r'\b' + re.escape(most_relevant_term) + r'\b'
-    matches = list(re.finditer(regex_pattern, content, re.IGNORECASE))
-
-    if not matches:
-        all_substring_matches = list(re.finditer(re.escape(most_relevant_term), content, re.IGNORECASE))
-        valid_matches = []
-        boundary_chars = string.whitespace + string.punctuation
-        for match in all_substring_matches:
-            start_index, end_index = match.start(), match.end()
-            char_before = content[start_index - 1] if start_index > 0 else ' '
-            is_start_boundary = (start_index == 0) or (char_before in boundary_chars)
-            char_after = content[end_index] if end_index < len(content) else ' '
-            is_end_boundary = (end_index == len(content)) or (char_after in boundary_chars)
-            
-            if is_start_boundary and is_end_boundary:
-                # Casos especiais para 't e 'd (ex: don't, I'd)
-                if most_relevant_term == 't' and (char_before == "'" or char_after == "'"):
-                    continue
-                if most_relevant_term == 'd' and char_after == "'":
-                    continue
-                valid_matches.append(match)
-        matches = valid_matches
-
-    if not matches: return None
-    
-    # Filtra novamente para garantir
-    filtered_matches = []
-    for match in matches:
-        start_index = match.start()
-        end_index = match.end()
-        char_before = content[start_index - 1] if start_index > 0 else ' '
-        char_after = content[end_index] if end_index < len(content) else ' '
-        if most_relevant_term == 't' and (char_before == "'" or char_after == "'"):
-            continue
-        if most_relevant_term == 'd' and char_after == "'":
-            continue
-        filtered_matches.append(match)
-    matches = filtered_matches
+    matches = list(_compile_term_regex(most_relevant_term).finditer(content))
 
     if not matches: return None
     # --- Fim da lógica ---
@@ -138,6 +163,29 @@ def generate_snippet(doc_id, query_terms):
     snippet_string = f"{prefix}<mark>{term_in_doc}</mark>{suffix}"
     return title, snippet_string
 
+def build_page_results(ranked, start_index):
+    """
+    Gera os snippets só para a página pedida (em paralelo, mantendo a ordem).
+    Se algum resultado não gerar snippet, puxa os próximos da lista para completar a página.
+    """
+    results = []
+    pos = max(start_index, 0)
+    while len(results) < RESULTS_PER_PAGE and pos < len(ranked):
+        candidates = ranked[pos : pos + RESULTS_PER_PAGE - len(results) + SNIPPET_SLACK]
+        if not candidates: break
+        pos += len(candidates)
+        
+        snippets = SNIPPET_POOL.map(lambda result: generate_snippet(result[0], result[1]), candidates)
+        for (doc_id, _, _), snippet_data in zip(candidates, snippets):
+            if snippet_data and len(results) < RESULTS_PER_PAGE:
+                title, snippet = snippet_data
+                results.append({
+                    'doc_id': doc_id, # Passa o doc_id para o link
+                    'title': title,
+                    'snippet': snippet
+                })
+    return results
+
 def get_pagination_range(current_page, total_pages, window=2):
     """Cria a lista de páginas (ex: [1, '...', 4, 5, 6, '...', 10])."""
     if total_pages <= (2 * window + 5): return range(1, total_pages + 1)
@@ -162,34 +210,22 @@ def index():
 def search():
     """Página de resultados da busca."""
     query = request.args.get('query', '')
-    page = request.args.get('page', 1, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
 
     results_for_page, total_pages, total_results, pagination_range = [], 0, 0, []
 
     if query and retriever.is_ready:
-        all_ranked_ids = retriever.search(query)
-        # Pega só os termos da query (sem operadores)
-        query_terms = {t for t in retriever._tokenize_query(query) if t not in OP_PRECEDENCE}
+        all_ranked = retriever.search(query)
         
-        # Gera snippets e filtra resultados inválidos
-        valid_results = []
-        for doc_id in all_ranked_ids:
-            snippet_data = generate_snippet(doc_id, query_terms)
-            if snippet_data:
-                title, snippet = snippet_data
-                valid_results.append({
-                    'doc_id': doc_id, # Passa o doc_id para o link
-                    'title': title,
-                    'snippet': snippet
-                })
+        # Pré-filtro barato: descarta DocIDs sem arquivo mapeado ou sem título
+        all_ranked = [r for r in all_ranked if _doc_path(r[0]) and _doc_title(r[0]) != ""]
         
-        # Calcula a paginação
-        total_results = len(valid_results)
+        # Calcula a paginação (assume que quase todos os resultados geram snippet)
+        total_results = len(all_ranked)
         total_pages = (total_results + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE
         
         start_index = (page - 1) * RESULTS_PER_PAGE
-        end_index = start_index + RESULTS_PER_PAGE
-        results_for_page = valid_results[start_index:end_index]
+        results_for_page = build_page_results(all_ranked, start_index)
         
         if total_pages > 1:
             pagination_range = get_pagination_range(page, total_pages)
@@ -208,19 +244,16 @@ def search():
 def show_document(doc_id):
     """Exibe o conteúdo completo de um documento."""
     
-    relative_path = doc_map.get(doc_id)
-    if not relative_path:
-        return render_template('document.html', title="Erro", body="Documento não encontrado.")
-
-    full_path = os.path.join(CORPUS_PATH, relative_path)
-
     try:
-        with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-            title = f.readline().strip()
-            body = f.read()
+        doc = _load_doc(doc_id)
     except FileNotFoundError:
+        full_path = os.path.join(CORPUS_PATH, _doc_path(doc_id))
         return render_template('document.html', title="Erro", body=f"Arquivo {full_path} não encontrado.")
     
+    if not doc:
+        return render_template('document.html', title="Erro", body="Documento não encontrado.")
+    
+    title, body = doc
     return render_template('document.html', title=title, body=body)
 
 # --- EXECUÇÃO ---
@@ -228,7 +261,7 @@ def show_document(doc_id):
 if __name__ == '__main__':
     
     # Verifica se os arquivos de índice existem. Se não, roda a indexação.
-    if not all(os.path.exists(f) for f in [TRIE_FILE, STATS_FILE, MAP_FILE]):
+    if not all(os.path.exists(f) for f in [TRIE_FILE, postings_filename(TRIE_FILE), STATS_FILE, MAP_FILE, TITLES_FILE, CORPUS_FILE, OFFSETS_FILE, FORWARD_FILE, MANIFEST_FILE]):
         print("="*60)
         print("ATENÇÃO: Arquivos de índice não encontrados.")
         print("Iniciando o processo de indexação automaticamente...")
@@ -236,7 +269,9 @@ if __name__ == '__main__':
         print("="*60)
         
         try:
-            indexer = Indexer(corpus_path=CORPUS_PATH, trie_file=TRIE_FILE, map_file=MAP_FILE, stats_file=STATS_FILE)
+            indexer = Indexer(corpus_path=CORPUS_PATH, trie_file=TRIE_FILE, map_file=MAP_FILE, stats_file=STATS_FILE, titles_file=TITLES_FILE,
+                              corpus_file=CORPUS_FILE, offsets_file=OFFSETS_FILE, forward_file=FORWARD_FILE,
+                              manifest_file=MANIFEST_FILE)
             indexer.index_corpus()
             print("\nIndexação concluída com sucesso!")
             print("O servidor será reiniciado. Recarregue a página.")
@@ -1,21 +1,228 @@
+import os
+import mmap
+import struct
+from array import array
+from bisect import insort
+
+import numpy as np
+
+
+# Cabeçalho binário de cada nó no arquivo da Trie, seguido do rótulo em UTF-8:
+# (tam_rótulo, is_terminal, num_filhos, offset, nbytes, num_postings, doc_bits, tf_bits)
+# onde offset/nbytes localizam as postings do nó no arquivo .bin
+_NODE_HEADER = struct.Struct("<HBHQIIBB")
+
+# Cabeçalho do arquivo da Trie, antes do primeiro nó: (assinatura, maior DocID do índice)
+_FILE_HEADER = struct.Struct("<4sI")
+_FILE_MAGIC = b"CTR1"
+
+def postings_filename(trie_file: str) -> str:
+    """ Caminho do arquivo binário de postings que acompanha o arquivo da Trie. """
+    return os.path.splitext(trie_file)[0] + ".bin"
+
+def _pack_bits(values: np.ndarray, bits: int) -> bytes:
+    """ Empacota cada valor em exatamente `bits` bits (little-endian, sem alinhamento). """
+    shifts = np.arange(bits, dtype=np.uint32)
+    bit_matrix = ((values[:, None] >> shifts) & 1).astype(np.uint8)
+    return np.packbits(bit_matrix, bitorder='little').tobytes()
+
+def _unpack_bits(block: np.ndarray, count: int, bits: int) -> np.ndarray:
+    """ Inverso de _pack_bits: devolve `count` valores uint32 de `bits` bits cada. """
+    shifts = np.arange(bits, dtype=np.uint32)
+    bit_matrix = np.unpackbits(block, count=count * bits, bitorder='little').reshape(count, bits)
+    return (bit_matrix.astype(np.uint32) << shifts).sum(axis=1, dtype=np.uint32)
+
+def _encode_postings(doc_ids: np.ndarray, tfs: np.ndarray):
+    """
+    Codifica as postings de um nó em bytes.
+    DocIDs viram deltas empacotados com o mínimo de bits; termos muito densos
+    usam um bitmap de DocIDs (doc_bits = 0). Retorna (bytes, doc_bits, tf_bits).
+    """
+    deltas = np.diff(doc_ids, prepend=0).astype(np.uint32)
+    doc_bits = max(int(deltas.max()).bit_length(), 1)
+    tf_bits = max(int(tfs.max()).bit_length(), 1)
+
+    packed_size = (len(doc_ids) * doc_bits + 7) // 8
+    bitmap_size = (int(doc_ids[-1]) + 1 + 7) // 8
+    if bitmap_size < packed_size:
+        # Layout denso: um bit por DocID possível
+        bitmap = np.zeros(int(doc_ids[-1]) + 1, dtype=np.uint8)
+        bitmap[doc_ids] = 1
+        doc_block = np.packbits(bitmap, bitorder='little').tobytes()
+        doc_bits = 0
+    else:
+        doc_block = _pack_bits(deltas, doc_bits)
+
+    return doc_block + _pack_bits(tfs, tf_bits), doc_bits, tf_bits
+
+def _decode_postings(block: np.ndarray, count: int, doc_bits: int, tf_bits: int):
+    """ Inverso de _encode_postings: devolve os arrays (doc_ids, tfs). """
+    tf_size = (count * tf_bits + 7) // 8
+    doc_block, tf_block = block[:len(block) - tf_size], block[len(block) - tf_size:]
+
+    if doc_bits == 0:
+        doc_ids = np.flatnonzero(np.unpackbits(doc_block, bitorder='little')).astype(np.uint32)
+    else:
+        doc_ids = np.cumsum(_unpack_bits(doc_block, count, doc_bits), dtype=np.uint32)
+
+    return doc_ids, _unpack_bits(tf_block, count, tf_bits)
+
+# Nós com até SMALL_NODE_MAX filhos guardam uma lista ordenada de (byte, filho);
+# acima disso viram nós "largos": um array de WIDE_NODE_SIZE posições indexado pelo byte
+SMALL_NODE_MAX = 4
+WIDE_NODE_SIZE = 256
+
+# Termos presentes em mais que esta fração dos docs ganham também um bitmap denso ao carregar
+DENSE_THRESHOLD = 0.1
+
+
 class TrieNode:
     """ Representa um nó na Árvore Trie Compacta. """
+    # Sem __dict__ por nó: a Trie tem um nó por termo (ou mais), e o dict custa centenas de bytes
+    __slots__ = ('label', 'children', 'num_children', 'is_terminal', '_doc_ids', '_tfs', '_packed', 'bitmap')
+
     def __init__(self):
         self.label = ""
-        # Dicionário onde a chave é o primeiro caractere do rótulo do filho
-        self.children = {}
+        # Filhos indexados pelo primeiro caractere do rótulo (None, lista pequena ou array largo)
+        self.children = None
+        self.num_children = 0
         self.is_terminal = False
-        # Lista de (DocID, Frequência)
-        self.inverted_index = []
+        # Índice invertido em arrays paralelos (SoA) de uint32: DocIDs ordenados e Frequências.
+        # array.array cresce por append amortizado e ocupa 4 bytes por valor
+        self._doc_ids = array('I')
+        self._tfs = array('I')
+        # Postings ainda codificadas, como lidas do disco: (bloco, num_postings, doc_bits, tf_bits).
+        # Só são decodificadas no primeiro acesso (a maioria dos termos nunca é consultada)
+        self._packed = None
+        # Bitmap denso (np.bool_, posição = DocID) para termos muito frequentes; None nos demais
+        self.bitmap = None
+
+    def _unpack(self):
+        """
+        Decodifica as postings guardadas em _packed (carregamento preguiçoso).
+        Seguro com várias threads de busca no mesmo nó: decodifica de uma cópia local de
+        _packed e só o zera depois de trocar as postings (quem perder a corrida decodifica
+        de novo o mesmo bloco, com o mesmo resultado). Não mexe no bitmap.
+        """
+        packed = self._packed
+        if packed is None:
+            return
+        block, count, doc_bits, tf_bits = packed
+        doc_ids, tfs = _decode_postings(block, count, doc_bits, tf_bits)
+        self._doc_ids = array('I', doc_ids.astype(np.uint32, copy=False).tobytes())
+        self._tfs = array('I', tfs.astype(np.uint32, copy=False).tobytes())
+        self._packed = None
+
+    @property
+    def num_postings(self) -> int:
+        """ Quantidade de postings, sem precisar decodificá-las. """
+        packed = self._packed
+        if packed is not None:
+            return packed[1]
+        return len(self._doc_ids)
+
+    @property
+    def doc_ids(self) -> np.ndarray:
+        """ DocIDs (ordenados) como np.ndarray uint32, sem cópia. """
+        self._unpack()
+        return np.frombuffer(self._doc_ids, dtype=np.uint32)
+
+    @property
+    def tfs(self) -> np.ndarray:
+        """ Frequências, paralelas a doc_ids, como np.ndarray uint32, sem cópia. """
+        self._unpack()
+        return np.frombuffer(self._tfs, dtype=np.uint32)
+
+    def add_posting(self, doc_id: int, frequency: int):
+        """ Acrescenta (DocID, Frequência) ao índice invertido do nó. """
+        self._unpack()
+        # Os documentos são indexados em ordem crescente, então doc_ids segue ordenado
+        self._doc_ids.append(doc_id)
+        self._tfs.append(frequency)
+
+    def set_postings(self, doc_ids: np.ndarray, tfs: np.ndarray):
+        """ Substitui o índice invertido pelos arrays uint32 dados (ex: ao carregar do disco). """
+        self._doc_ids = array('I', doc_ids.astype(np.uint32, copy=False).tobytes())
+        self._tfs = array('I', tfs.astype(np.uint32, copy=False).tobytes())
+        self._packed = None
+        self.bitmap = None
+
+    def get_child(self, char: str):
+        """ Retorna o filho cujo rótulo começa com `char`, ou None. """
+        children = self.children
+        if children is None:
+            return None
+        
+        key = ord(char)
+        if len(children) == WIDE_NODE_SIZE:
+            return children[key] if key < WIDE_NODE_SIZE else None
+        
+        for child_key, child in children:
+            if child_key == key:
+                return child
+        return None
+
+    def set_child(self, child: "TrieNode"):
+        """ Liga (ou substitui) o filho indexado pelo primeiro caractere do seu rótulo. """
+        key = ord(child.label[0])
+        if key >= WIDE_NODE_SIZE:
+            raise ValueError(f"Caractere fora do intervalo suportado pela Trie: {child.label[0]!r}")
+        
+        children = self.children
+        if children is None:
+            self.children = [(key, child)]
+            self.num_children = 1
+            return
+        
+        if len(children) == WIDE_NODE_SIZE:
+            if children[key] is None:
+                self.num_children += 1
+            children[key] = child
+            return
+        
+        for i, (child_key, _) in enumerate(children):
+            if child_key == key:
+                children[i] = (key, child)
+                return
+        
+        if len(children) < SMALL_NODE_MAX:
+            # Mantém a lista pequena ordenada pelo byte da chave
+            insort(children, (key, child), key=lambda item: item[0])
+        else:
+            # Promove para nó largo
+            wide = [None] * WIDE_NODE_SIZE
+            for child_key, other in children:
+                wide[child_key] = other
+            wide[key] = child
+            self.children = wide
+        self.num_children += 1
+
+    def child_nodes(self) -> list:
+        """ Lista dos filhos em ordem alfabética da chave. """
+        children = self.children
+        if children is None:
+            return []
+        if len(children) == WIDE_NODE_SIZE:
+            return [child for child in children if child is not None]
+        return [child for _, child in children]
 
 class CompactTrie:
     """ Implementação da Árvore Trie Compacta (Radix Tree). """
     def __init__(self):
         self.root = TrieNode()
+        # Maior DocID do índice carregado (tamanho dos bitmaps densos - 1)
+        self.num_docs = 0
         
     def _find_mismatch_point(self, word, label):
         """ Retorna o comprimento do prefixo comum entre a palavra e o rótulo. """
-        i = 0
+        # Casos mais comuns (um é prefixo do outro) resolvidos pelo startswith, em C
+        if word.startswith(label):
+            return len(label)
+        if label.startswith(word):
+            return len(word)
+        
+        # Divergência: o primeiro caractere já coincide (chave do filho)
+        i = 1 if word[:1] == label[:1] else 0
         min_len = min(len(word), len(label))
         while i < min_len and word[i] == label[i]:
             i += 1
@@ -23,23 +230,40 @@ class CompactTrie:
 
     def insert(self, word: str, doc_id: int, frequency: int):
         """ Insere uma palavra na Trie e atualiza seu índice invertido. """
+        node = self._insert_node(word)
+        if node is not None:
+            node.add_posting(doc_id, frequency)
+
+    def bulk_insert(self, postings):
+        """
+        Insere de uma vez termos com todas as suas postings: `postings` é um iterável de
+        (palavra, doc_ids, tfs), com os DocIDs ordenados. Desce a Trie uma vez por termo,
+        e não uma vez por (termo, documento) como em insert().
+        """
+        for word, doc_ids, tfs in postings:
+            node = self._insert_node(word)
+            if node is not None:
+                node.set_postings(doc_ids, tfs)
+
+    def _insert_node(self, word: str):
+        """ Garante o caminho da palavra na Trie e devolve seu nó terminal (None se a palavra é vazia). """
         current_node = self.root
         remaining_word = word
         
         while remaining_word:
             char = remaining_word[0]
             
-            if char not in current_node.children:
+            child_node = current_node.get_child(char)
+            
+            if child_node is None:
                 # Caso 1: Não há caminho. (Inserção simples)
                 new_node = TrieNode()
                 new_node.label = remaining_word
                 new_node.is_terminal = True
-                new_node.inverted_index.append((doc_id, frequency))
                 
-                current_node.children[char] = new_node
-                return
+                current_node.set_child(new_node)
+                return new_node
             
-            child_node = current_node.children[char]
             child_label = child_node.label
             
             mismatch_idx = self._find_mismatch_point(remaining_word, child_label)
@@ -49,8 +273,7 @@ class CompactTrie:
             # ----------------------------------------------------
             if mismatch_idx == len(remaining_word) and mismatch_idx == len(child_label):
                 child_node.is_terminal = True 
-                child_node.inverted_index.append((doc_id, frequency))
-                return
+                return child_node
             
             # ----------------------------------------------------
             # B. Palavra é Prefixo de Rótulo: (Palavra é mais curta)
@@ -62,18 +285,17 @@ class CompactTrie:
                 new_node = TrieNode()
                 new_node.label = remaining_word
                 new_node.is_terminal = True
-                new_node.inverted_index.append((doc_id, frequency))
                 
                 # 2. Atualiza o nó antigo (resto)
                 remaining_label = child_label[mismatch_idx:]
                 child_node.label = remaining_label
                 
                 # 3. Liga o nó antigo ao novo
-                new_node.children[remaining_label[0]] = child_node
+                new_node.set_child(child_node)
                 
                 # 4. Liga o novo nó ao pai
-                current_node.children[char] = new_node
-                return
+                current_node.set_child(new_node)
+                return new_node
             
             # ----------------------------------------------------
             # C. Rótulo é Prefixo de Palavra: (Palavra é mais longa)
@@ -97,25 +319,26 @@ class CompactTrie:
                 child_node.label = child_label[mismatch_idx:]
                 
                 # 3. Liga o nó filho ao nó de divisão
-                split_node.children[child_node.label[0]] = child_node
+                split_node.set_child(child_node)
                 
                 # 4. O restante da nova palavra vira um novo nó filho
                 new_word_part = remaining_word[mismatch_idx:]
                 new_node = TrieNode()
                 new_node.label = new_word_part
                 new_node.is_terminal = True
-                new_node.inverted_index.append((doc_id, frequency))
                 
-                split_node.children[new_word_part[0]] = new_node
+                split_node.set_child(new_node)
                 
                 # 5. Liga o nó de divisão ao nó atual
-                current_node.children[char] = split_node
-                return
+                current_node.set_child(split_node)
+                return new_node
     
-    def find(self, word: str) -> list:
+        return None
+
+    def find(self, word: str):
         """
         Busca uma palavra na Trie Compacta.
-        Retorna o índice invertido (lista) ou [] se não encontrar.
+        Retorna o nó terminal (com doc_ids/tfs) ou None se não encontrar.
         """
         current_node = self.root
         remaining_word = word
@@ -123,60 +346,100 @@ class CompactTrie:
         while remaining_word:
             char = remaining_word[0]
             
-            if char not in current_node.children:
-                return []
+            child_node = current_node.get_child(char)
+            if child_node is None:
+                return None
             
-            child_node = current_node.children[char]
             child_label = child_node.label
             
-            mismatch_idx = self._find_mismatch_point(remaining_word, child_label)
-            
-            if mismatch_idx == len(remaining_word):
-                if mismatch_idx == len(child_label):
-                    # Match exato
-                    current_node = child_node
-                    remaining_word = "" 
-                    break
-                
-                return [] # Palavra é prefixo de um rótulo, mas não é nó
-
-            elif mismatch_idx == len(child_label):
-                # Rótulo é prefixo da palavra, continua descendo
+            # Comparações de prefixo direto em C (o ponto exato de divergência não importa aqui)
+            if remaining_word.startswith(child_label):
+                # Rótulo é prefixo da palavra (ou igual a ela): continua descendo
                 current_node = child_node
-                remaining_word = remaining_word[mismatch_idx:]
+                remaining_word = remaining_word[len(child_label):]
                 
-            else: 
-                # Divergência
-                return []
+            else:
+                # Palavra é prefixo de um rótulo (não é nó) ou divergência
+                return None
         
         if current_node.is_terminal:
-            return current_node.inverted_index
+            return current_node
         else:
-            return []
+            return None
         
-    def pre_order_serialize(self, node: TrieNode, file_handler):
-        """ Função auxiliar recursiva para serializar em Pré-Ordem. """
-        index_str = ";".join([f"{doc},{freq}" for doc, freq in node.inverted_index])
-        
-        # Formato: "label|is_terminal|num_children|inverted_index_string"
-        line = f"{node.label}|{1 if node.is_terminal else 0}|{len(node.children)}|{index_str}\n"
+    def _pre_order_serialize(self):
+        """
+        Serializa a Trie em Pré-Ordem com uma DFS iterativa (pilha explícita).
+        Retorna (bytes da estrutura, com o cabeçalho do arquivo, bytes das postings).
+        """
+        records = bytearray()
+        postings = bytearray()
+        stack = [self.root]
+        num_docs = self.num_docs
         
-        file_handler.write(line)
+        while stack:
+            node = stack.pop()
+            
+            # As postings vão para o arquivo .bin; o registro guarda só a referência
+            offset, nbytes, doc_bits, tf_bits = 0, 0, 0, 0
+            packed = node._packed
+            if packed is not None:
+                # Ainda codificadas como vieram do disco: copia o bloco sem decodificar
+                block, _, doc_bits, tf_bits = packed
+                offset, nbytes = len(postings), len(block)
+                postings += block.tobytes()
+            elif len(node._doc_ids):
+                block, doc_bits, tf_bits = _encode_postings(node.doc_ids, node.tfs)
+                offset, nbytes = len(postings), len(block)
+                postings += block
+                num_docs = max(num_docs, node._doc_ids[-1])
+            
+            # Registro: cabeçalho de tamanho fixo + rótulo
+            label = node.label.encode('utf-8')
+            records += _NODE_HEADER.pack(len(label), node.is_terminal, node.num_children,
+                                         offset, nbytes, node.num_postings, doc_bits, tf_bits)
+            records += label
+            
+            # Os filhos já estão em ordem; empilha invertido para visitá-los em ordem
+            stack.extend(reversed(node.child_nodes()))
         
-        for char in sorted(node.children.keys()):
-            child_node = node.children[char]
-            self.pre_order_serialize(child_node, file_handler)
+        return _FILE_HEADER.pack(_FILE_MAGIC, num_docs) + bytes(records), bytes(postings)
             
     def save_to_file(self, filename: str):
-        """ Persiste a CompactTrie em disco. """
-        print(f"Salvando índice para {filename}...")
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                self.pre_order_serialize(self.root, f)
-            print("Salvamento concluído.")
-        except Exception as e:
-            print(f"Erro ao salvar o índice: {e}")
+        """
+        Persiste a CompactTrie em disco (estrutura + postings, ambos binários).
+        Não imprime nada (pode rodar numa thread do indexador); erros de escrita são
+        propagados, para quem chamou não dar o índice como salvo.
+        """
+        structure, postings = self._pre_order_serialize()
+        with open(filename, 'wb') as f:
+            f.write(structure)
+        with open(postings_filename(filename), 'wb') as pf:
+            pf.write(postings)
+            
+    @staticmethod
+    def _read_node(buf, pos: int, postings_buf: np.ndarray):
+        """ Lê o registro do nó em `pos`. Retorna (nó, num_filhos, próxima_posição). """
+        label_len, is_terminal, num_children, offset, nbytes, count, doc_bits, tf_bits = _NODE_HEADER.unpack_from(buf, pos)
+        pos += _NODE_HEADER.size
+        
+        node = TrieNode()
+        node.label = buf[pos:pos + label_len].decode('utf-8')
+        node.is_terminal = bool(is_terminal)
+        if count:
+            # Decodificadas só quando o termo for consultado
+            node._packed = (postings_buf[offset:offset + nbytes], count, doc_bits, tf_bits)
             
+        return node, num_children, pos + label_len
+
+    def _build_dense_bitmaps(self, nodes: list):
+        """ Cria o bitmap dos nós cujas postings cobrem mais de DENSE_THRESHOLD dos docs. """
+        for node in nodes:
+            if node.num_postings > DENSE_THRESHOLD * self.num_docs:
+                bitmap = np.zeros(self.num_docs + 1, dtype=bool)
+                bitmap[node.doc_ids] = True
+                node.bitmap = bitmap
+
     def load_from_file(self, filename: str):
         """ Carrega a CompactTrie do disco, reconstruindo a estrutura. """
         print(f"Carregando índice de {filename}...")
@@ -185,51 +448,42 @@ class CompactTrie:
         stack = [] 
         
         self.root = TrieNode()
+        self.num_docs = 0
+        # Nós com postings, para escolher depois quais ganham bitmap
+        posting_nodes = []
         
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                
-                # 1. Processa a raiz (primeira linha)
-                first_line = f.readline()
-                if not first_line:
-                    return False # Arquivo vazio
-                
-                label, is_terminal_str, num_children_str, index_str = first_line.strip().split('|')
+            if os.path.getsize(filename) == 0:
+                return False # Arquivo vazio
+            
+            postings_buf = np.fromfile(postings_filename(filename), dtype=np.uint8)
+
+            with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
                 
-                self.root.label = label 
-                self.root.is_terminal = is_terminal_str == '1'
-                num_children = int(num_children_str)
+                # 0. Cabeçalho do arquivo
+                magic, num_docs = _FILE_HEADER.unpack_from(mm, 0)
+                if magic != _FILE_MAGIC:
+                    print(f"Arquivo {filename} em formato antigo ou inválido.")
+                    return False
                 
-                if index_str:
-                    for item in index_str.split(';'):
-                        doc_id, freq = map(int, item.split(','))
-                        self.root.inverted_index.append((doc_id, freq))
+                # 1. Processa a raiz (primeiro registro)
+                self.root, num_children, pos = self._read_node(mm, _FILE_HEADER.size, postings_buf)
+                if self.root.num_postings: posting_nodes.append(self.root)
                 
                 if num_children > 0:
                     stack.append((self.root, num_children))
 
                 # 2. Processa os descendentes
-                for line in f:
+                while pos < len(mm):
                     if not stack:
                         break 
                         
                     parent_node, remaining_children = stack[-1] 
                     
-                    label, is_terminal_str, num_children_str, index_str = line.strip().split('|')
-                    
-                    new_node = TrieNode()
-                    new_node.label = label
-                    new_node.is_terminal = is_terminal_str == '1'
-                    new_node.children = {}
-                    new_node.inverted_index = []
-                    num_children = int(num_children_str)
-                    
-                    if index_str:
-                        for item in index_str.split(';'):
-                            doc_id, freq = map(int, item.split(','))
-                            new_node.inverted_index.append((doc_id, freq))
+                    new_node, num_children, pos = self._read_node(mm, pos, postings_buf)
+                    if new_node.num_postings: posting_nodes.append(new_node)
 
-                    parent_node.children[new_node.label[0]] = new_node
+                    parent_node.set_child(new_node)
                     
                     remaining_children -= 1
                     if remaining_children == 0:
@@ -239,6 +493,10 @@ class CompactTrie:
                         
                     if num_children > 0:
                         stack.append((new_node, num_children))
+            
+            # 3. Layout por densidade: termos frequentes também como bitmap
+            self.num_docs = num_docs
+            self._build_dense_bitmaps(posting_nodes)
                         
             print("Carregamento concluído.")
             return True
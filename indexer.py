@@ -1,163 +1,513 @@
 import os
-import re
+import sys
 import json
-from collections import defaultdict
-import math
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import mmap
+import numpy as np
+from array import array
 from compact_trie import CompactTrie, TrieNode 
+from json_io import load_json, save_json
+
+# Hash do conteúdo de cada arquivo, para a indexação incremental: xxhash (opcional)
+# é mais rápido; senão o blake2b de 64 bits da hashlib
+try:
+    import xxhash
+    HASH_NAME = "xxh64"
+    def _content_hash(data: bytes) -> str:
+        return xxhash.xxh64(data).hexdigest()
+except ImportError:
+    import hashlib
+    HASH_NAME = "blake2b-64"
+    def _content_hash(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+# tqdm (opcional) mostra o progresso da Passagem 1 e limita sozinho a frequência de redesenho;
+# sem ele, o progresso é impresso no máximo a cada PROGRESS_INTERVAL segundos
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# Tokens são sequências de [a-z0-9&-]: a tabela já converte A-Z para a-z e troca qualquer
+# outro byte por espaço, e aí basta um split (uma só passada de translate, sem lower nem regex)
+_TOKEN_BYTES = set(b'abcdefghijklmnopqrstuvwxyz0123456789&-')
+_TOKEN_TRANS = bytes(c if c in _TOKEN_BYTES else c | 0x20 if 0x41 <= c <= 0x5A else 0x20 for c in range(256))
+
+# Arquivos entregues de uma vez a cada processo do pool de tokenização
+TOKENIZE_CHUNKSIZE = 32
+# Threads que gravam os arquivos do índice em paralelo no fim da indexação
+SAVE_WORKERS = 3
+# Intervalo mínimo (s) entre mensagens de progresso quando o tqdm não está instalado
+PROGRESS_INTERVAL = 5.0
+# Capacidade inicial dos arrays de estatísticas por termo (dobra quando enche)
+STATS_INITIAL_CAPACITY = 1 << 14
+
+def _welford_update_numpy(term_ids, tfs, df, mean, m2):
+    """
+    Passo de Welford (média e M2 online, estáveis) vetorizado para os termos de um doc.
+    Cada term_id aparece uma vez por doc, então a indexação por array não tem colisões.
+    """
+    df[term_ids] += 1
+    delta = tfs - mean[term_ids]
+    mean[term_ids] += delta / df[term_ids]
+    m2[term_ids] += delta * (tfs - mean[term_ids])
+
+# Numba (opcional) compila o mesmo passo como um laço nativo, sem os arrays temporários
+try:
+    from numba import njit
+
+    @njit(cache=True, nogil=True)
+    def _welford_update(term_ids, tfs, df, mean, m2):
+        for i in range(len(term_ids)):
+            term_id = term_ids[i]
+            tf = tfs[i]
+            df[term_id] += 1
+            delta = tf - mean[term_id]
+            mean[term_id] += delta / df[term_id]
+            m2[term_id] += delta * (tf - mean[term_id])
+except ImportError:
+    _welford_update = _welford_update_numpy
+
+def _read_file(file_path_full) -> bytes:
+    """
+    Lê o arquivo inteiro com o mínimo de syscalls (open, fstat, read, close),
+    sem o buffer e o objeto de arquivo do open() do Python.
+    """
+    fd = os.open(file_path_full, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size)
+        if len(data) < size:
+            # Leitura curta (ex: arquivo enorme ou sistema de arquivos especial): completa em laço
+            parts = [data]
+            while True:
+                chunk = os.read(fd, 1 << 20)
+                if not chunk: break
+                parts.append(chunk)
+            data = b"".join(parts)
+        return data
+    finally:
+        os.close(fd)
+
+def iter_txt(root):
+    """
+    Percorre `root` com os.scandir e gera (DirEntry) os arquivos .txt, um a um.
+    O tipo vem do próprio dirent (sem stat por entrada) e links para diretórios não são seguidos.
+    A ordem é a mesma do os.walk (arquivos do diretório, depois cada subdiretório em pré-ordem).
+    """
+    stack = [root]
+    while stack:
+        subdirs = []
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith('.txt') and entry.is_file():
+                    yield entry
+        # Invertidos na pilha para sair na ordem do scandir
+        stack.extend(reversed(subdirs))
+
+def _tokenize_file(job):
+    """
+    Lê um documento e conta seus termos (roda nos processos do pool).
+    `job` = (caminho, hash da indexação anterior ou None).
+    Retorna (bytes, Counter, hash); se o hash não mudou, não tokeniza e devolve (bytes, None, hash).
+    Se a leitura falhar, retorna (None, exceção, None).
+    """
+    file_path_full, known_hash = job
+    try:
+        data = _read_file(file_path_full)
+        digest = _content_hash(data)
+        if digest == known_hash:
+            return data, None, digest
+        return data, Indexer._tokenize_and_calculate_tf(data), digest
+    except Exception as e:
+        return None, e, None
 
 class Indexer:
     """
     Orquestra a indexação:
-    Lê o corpus, cria a Trie (índice), o mapa de docs e as estatísticas (Z-score).
+    Lê o corpus, cria a Trie (índice), o mapa de docs, os títulos e as estatísticas (Z-score).
+    Também concatena todos os documentos em um único arquivo (corpus.bin), com os
+    (offset, tamanho) de cada DocID em corpus_offsets.npy, para a interface ler por mmap.
+    O índice direto (DocID -> [(term_id, tf)]) vai em forward_index.npz, para o ranqueamento.
+    O manifesto (caminho -> tamanho, mtime, hash) permite reindexar só os arquivos alterados.
     """
     
-    def __init__(self, corpus_path: str, trie_file="inverted_index.txt", map_file="doc_id_map.json", stats_file="global_stats.json"):
+    def __init__(self, corpus_path: str, trie_file="inverted_index.trie", map_file="doc_id_map.json", stats_file="global_stats.json", titles_file="titles.json",
+                 corpus_file="corpus.bin", offsets_file="corpus_offsets.npy", forward_file="forward_index.npz",
+                 manifest_file="manifest.json"):
         self.corpus_path = corpus_path
         self.trie_file = trie_file
         self.map_file = map_file
         self.stats_file = stats_file
+        self.titles_file = titles_file
+        self.corpus_file = corpus_file
+        self.offsets_file = offsets_file
+        self.forward_file = forward_file
+        self.manifest_file = manifest_file
         
         self.trie = CompactTrie()
-        self.doc_map = {}
+        # Caminho relativo de cada doc; posição = DocID - 1
+        self.doc_map = []
+        # Título (primeira linha) de cada doc, para a interface não precisar abrir o arquivo
+        self.doc_titles = []
+        # (offset, tamanho) em bytes de cada doc dentro do corpus.bin, em pares planos
+        # de uint64 (8 bytes por valor, sem uma tupla por doc); par = DocID
+        self.doc_offsets = array('Q', [0, 0])
+        # Índice direto em CSR: os pares (term_id, tf) do DocID d ficam em [forward_ptr[d], forward_ptr[d+1])
+        self.term_ids = {}
+        self.forward_ptr = [0, 0]
+        self.forward_term_ids = array('I')
+        self.forward_tfs = array('I')
+        # Dados brutos para z-score em arrays paralelos (SoA) indexados por term_id:
+        # DF, média e M2 do TF (Welford), atualizados doc a doc na Passagem 1
+        self.stats_df = np.zeros(STATS_INITIAL_CAPACITY, dtype=np.int64)
+        self.stats_mean = np.zeros(STATS_INITIAL_CAPACITY, dtype=np.float64)
+        self.stats_m2 = np.zeros(STATS_INITIAL_CAPACITY, dtype=np.float64)
+        # Manifesto do corpus indexado: {caminho_relativo: [tamanho, mtime_ns, hash]}
+        self.manifest = {}
         # Guarda dados para z-score: {termo: {'mu': X, 'sigma': Y, 'df': Z}}
         self.global_stats = {} 
         self.total_docs = 0 
 
     def _load_or_create_index_data(self):
-        """Tenta carregar os dados (Trie, mapa, stats) do disco."""
+        """Tenta carregar os dados (Trie, mapa, títulos, stats) do disco."""
         
         if self.trie.load_from_file(self.trie_file):
             print(f"Índice carregado de {self.trie_file}.")
             
             try:
-                with open(self.map_file, 'r', encoding='utf-8') as f:
-                    doc_map_str = json.load(f)
-                    self.doc_map = {int(k): v for k, v in doc_map_str.items()}
-                    self.total_docs = len(self.doc_map)
+                doc_map = load_json(self.map_file)
+                if not isinstance(doc_map, list): raise ValueError("formato antigo")
+                self.doc_map = doc_map
+                self.total_docs = len(self.doc_map)
             except (FileNotFoundError, json.JSONDecodeError, ValueError):
                 print("Mapeamento não encontrado ou corrompido.")
             
             try:
-                with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    self.global_stats = json.load(f)
+                doc_titles = load_json(self.titles_file)
+                if not isinstance(doc_titles, list): raise ValueError("formato antigo")
+                self.doc_titles = doc_titles
+            except (FileNotFoundError, json.JSONDecodeError, ValueError):
+                print("Títulos não encontrados ou corrompidos.")
+            
+            try:
+                self.global_stats = load_json(self.stats_file)
             except (FileNotFoundError, json.JSONDecodeError, ValueError):
                 print("Estatísticas não encontradas ou corrompidas.")
 
-            # Retorna True se tudo foi carregado
-            if self.doc_map and self.global_stats:
+            # Retorna True se tudo foi carregado (o corpus concatenado só precisa existir)
+            corpus_ok = all(os.path.exists(f) for f in [self.corpus_file, self.offsets_file, self.forward_file])
+            if self.doc_map and self.doc_titles and self.global_stats and corpus_ok:
                 return True
         
-        print("Iniciando indexação a partir do zero.")
+        print("Índice em disco ausente ou incompleto; será refeito.")
         return False
 
-    def _tokenize_and_calculate_tf(self, text):
-        """Limpa o texto, quebra em tokens e conta a Frequência (TF)."""
-        text = text.lower()
-        tokens = re.findall(r'[a-z0-9&-]+', text)
+    @staticmethod
+    def _tokenize_and_calculate_tf(data: bytes):
+        """Limpa o texto (bytes crus do arquivo), quebra em tokens e conta a Frequência (TF)."""
+        # Tudo em bytes (um translate faz o lower ASCII e a limpeza); bytes não-ASCII do UTF-8
+        # viram espaço, então o resultado já é ASCII puro e só ele é decodificado
+        tokens = data.translate(_TOKEN_TRANS).decode('ascii').split()
         
-        term_frequency = defaultdict(int)
-        for token in tokens:
-            term_frequency[token] += 1
-            
-        return term_frequency
+        # Counter conta os tokens num laço em C
+        return Counter(tokens)
+
+    def _list_corpus_files(self):
+        """
+        (caminho, stat) de cada .txt do corpus; a ordem da travessia define os DocIDs.
+        O stat é feito uma única vez aqui e reaproveitado na verificação e no plano.
+        """
+        return [(entry.path, entry.stat()) for entry in iter_txt(self.corpus_path)]
+
+    def _load_manifest(self):
+        """Lê o manifesto da indexação anterior; {} se não existe ou é de outro hash."""
+        try:
+            manifest = load_json(self.manifest_file)
+            if manifest.get('hash') == HASH_NAME:
+                return manifest['files']
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, KeyError, AttributeError):
+            pass
+        return {}
+
+    def _corpus_changed(self, file_paths, manifest):
+        """Verifica (só por tamanho e mtime, sem ler os arquivos) se o corpus mudou desde o manifesto."""
+        if len(file_paths) != len(manifest):
+            return True
+        for file_path_full, st in file_paths:
+            entry = manifest.get(os.path.relpath(file_path_full, self.corpus_path))
+            if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+                return True
+        return False
+
+    def _load_previous_build(self):
+        """
+        Carrega o que a indexação anterior deixou em disco (corpus concatenado, títulos e
+        índice direto) para reaproveitar os docs inalterados. Retorna None se algo faltar.
+        """
+        try:
+            doc_map = load_json(self.map_file)
+            doc_titles = load_json(self.titles_file)
+            offsets = np.load(self.offsets_file)
+            with np.load(self.forward_file) as data:
+                forward = (data['doc_ptr'], data['term_ids'], data['tfs'], data['terms'].tolist())
+            with open(self.corpus_file, 'rb') as f:
+                corpus = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, KeyError):
+            return None
+        
+        return {
+            'doc_ids': {path: doc_id for doc_id, path in enumerate(doc_map, start=1)},
+            'titles': doc_titles, 'offsets': offsets, 'forward': forward, 'corpus': corpus,
+        }
+
+    @staticmethod
+    def _reuse_document(previous, old_doc_id, with_data=True):
+        """Bytes e TFs de um doc inalterado, tirados da indexação anterior (sem tokenizar)."""
+        data = None
+        if with_data:
+            offset, length = (int(x) for x in previous['offsets'][old_doc_id])
+            data = previous['corpus'][offset:offset + length]
+        
+        doc_ptr, term_ids, tfs, terms = previous['forward']
+        start, end = int(doc_ptr[old_doc_id]), int(doc_ptr[old_doc_id + 1])
+        term_frequencies = dict(zip([terms[i] for i in term_ids[start:end].tolist()], tfs[start:end].tolist()))
+        return data, term_frequencies
 
     def index_corpus(self):
-        """Orquestra a indexação (ou carrega se já existir)."""
+        """Orquestra a indexação (ou carrega se já existir), reaproveitando os docs inalterados."""
+        
+        file_paths = self._list_corpus_files()
+        old_manifest = self._load_manifest()
         
-        if self._load_or_create_index_data():
+        if not self._corpus_changed(file_paths, old_manifest) and self._load_or_create_index_data():
             return # Já estava pronto
         
-        doc_id_counter = 1
+        # A partir daqui os arquivos em disco vão sendo trocados: o manifesto anterior (já lido
+        # em old_manifest) sai primeiro, para que uma indexação interrompida no meio nunca seja
+        # tomada como válida (nem reaproveitada) na próxima execução
+        if os.path.exists(self.manifest_file):
+            os.remove(self.manifest_file)
         
-        # Passagem 1: Ler arquivos, construir Trie e coletar stats brutos.
-        raw_stats = {} 
-
-        print("Passagem 1: Lendo documentos e construindo a Trie...")
+        # Descarta o que tenha sido carregado parcialmente (ex: Trie ok, mapa em formato antigo)
+        self.trie = CompactTrie()
+        self.doc_map, self.doc_titles = [], []
+        
+        previous = self._load_previous_build() if old_manifest else None
+        if previous is None:
+            old_manifest = {}
+            print("Iniciando indexação a partir do zero.")
+        else:
+            # O vocabulário anterior é uma boa estimativa do novo: os arrays de stats crescem
+            # de uma vez, ainda vazios, em vez de dobrar (e copiar) durante a Passagem 1
+            self._grow_stats(len(previous['forward'][3]))
+        
+        # Docs com mesmo tamanho e mtime são reaproveitados sem nem serem lidos;
+        # os demais vão para o pool (que ainda compara o hash antes de tokenizar)
+        plan, jobs = [], []
+        for file_path_full, st in file_paths:
+            relative_path = os.path.relpath(file_path_full, self.corpus_path)
+            entry = old_manifest.get(relative_path)
+            old_doc_id = previous['doc_ids'].get(relative_path) if entry else None
+            unchanged = old_doc_id is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns
+            plan.append((file_path_full, relative_path, st, old_doc_id, unchanged))
+            if not unchanged:
+                jobs.append((file_path_full, entry[2] if old_doc_id is not None else None))
+        
+        num_reused = len(plan) - len(jobs)
+        if num_reused:
+            print(f"Reaproveitando {num_reused} documentos inalterados da indexação anterior.")
+        
+        # Passagem 1: Ler arquivos, montar o índice direto e coletar stats brutos.
+        print("Passagem 1: Lendo documentos...")
         
-        for root, _, files in os.walk(self.corpus_path):
-            for file_name in files:
-                if file_name.endswith('.txt'):
+        # O corpus novo vai para um temporário: o anterior ainda está mapeado em `previous`
+        corpus_tmp = self.corpus_file + ".tmp"
+        corpus_out = open(corpus_tmp, 'wb')
+        corpus_pos = 0
+        
+        # Leitura + tokenização em paralelo (um Counter por arquivo); a Trie e os
+        # stats são atualizados aqui, em série e na ordem dos arquivos
+        with ProcessPoolExecutor() as pool:
+            tokenized = pool.map(_tokenize_file, jobs, chunksize=TOKENIZE_CHUNKSIZE)
+            progress = tqdm(plan, total=len(plan), unit="doc") if tqdm is not None else plan
+            next_report = time.monotonic() + PROGRESS_INTERVAL
+            
+            for file_path_full, relative_path, st, old_doc_id, unchanged in progress:
+                if unchanged:
+                    data, term_frequencies = self._reuse_document(previous, old_doc_id)
+                    digest = old_manifest[relative_path][2]
+                else:
+                    data, term_frequencies, digest = next(tokenized)
+                    if data is not None and term_frequencies is None:
+                        # Hash igual ao anterior: conteúdo inalterado, só o mtime mudou
+                        _, term_frequencies = self._reuse_document(previous, old_doc_id, with_data=False)
+                
+                self.doc_map.append(relative_path)
+                self.doc_titles.append("")
+                doc_id = len(self.doc_map)
+                self.doc_offsets.extend((corpus_pos, 0))
+                
+                try:
+                    if data is None:
+                        raise term_frequencies # Erro de leitura no processo do pool
                     
-                    file_path_full = os.path.join(root, file_name)
-                    relative_path = os.path.relpath(file_path_full, self.corpus_path)
+                    # Lido como bytes: só o título é decodificado
+                    self.doc_titles[doc_id - 1] = data.partition(b'\n')[0].decode('utf-8', errors='ignore').strip()
                     
-                    doc_id = doc_id_counter
-                    self.doc_map[doc_id] = relative_path
-                    doc_id_counter += 1
+                    # Acrescenta os bytes ao corpus concatenado (a interface decodifica ao ler)
+                    corpus_out.write(data)
+                    self.doc_offsets[2 * doc_id + 1] = len(data)
+                    corpus_pos += len(data)
                     
-                    try:
-                        with open(file_path_full, 'r', encoding='utf-8', errors='ignore') as f:
-                            content = f.read()
+                    doc_start = len(self.forward_term_ids)
+                    for term, tf in term_frequencies.items():
+                        # Os termos chegam do pool como strings novas a cada doc: internados,
+                        # todas as ocorrências de um termo viram o mesmo objeto (hash já calculado)
+                        term = sys.intern(term)
                         
-                        term_frequencies = self._tokenize_and_calculate_tf(content)
+                        # 1. Insere no índice direto (a Trie é montada dele no fim)
+                        term_id = self.term_ids.setdefault(term, len(self.term_ids))
+                        self.forward_term_ids.append(term_id)
+                        self.forward_tfs.append(tf)
+                    
+                    # 2. Coleta dados para Z-score, todos os termos do doc de uma vez
+                    self._update_stats(np.frombuffer(self.forward_term_ids[doc_start:], dtype=np.uint32),
+                                       np.frombuffer(self.forward_tfs[doc_start:], dtype=np.uint32))
+                    
+                    self.manifest[relative_path] = [st.st_size, st.st_mtime_ns, digest]
                         
-                        for term, tf in term_frequencies.items():
-                            
-                            # 1. Insere na Trie
-                            self.trie.insert(term, doc_id, tf)
-                            
-                            # 2. Coleta dados para Z-score
-                            if term not in raw_stats:
-                                raw_stats[term] = {'sum_tf': 0, 'sum_tf2': 0, 'df': 0}
-
-                            raw_stats[term]['df'] += 1 
-                            raw_stats[term]['sum_tf'] += tf
-                            raw_stats[term]['sum_tf2'] += (tf ** 2)
-                            
-                        self.total_docs = doc_id
-                        if doc_id % 200 == 0:
-                            print(f"Indexados {doc_id} documentos...")
-                            
-                    except Exception as e:
-                        print(f"Erro ao processar o arquivo {file_path_full}: {e}")
+                    self.total_docs = doc_id
+                    if tqdm is None and time.monotonic() >= next_report:
+                        print(f"Indexados {doc_id} documentos...")
+                        next_report = time.monotonic() + PROGRESS_INTERVAL
+                        
+                except Exception as e:
+                    print(f"Erro ao processar o arquivo {file_path_full}: {e}")
+                
+                # Fecha a linha do doc no índice direto
+                self.forward_ptr.append(len(self.forward_term_ids))
+
+        corpus_out.close()
+        print(f"Indexados {self.total_docs} documentos.")
+        if previous is not None and isinstance(previous['corpus'], mmap.mmap):
+            previous['corpus'].close()
+        os.replace(corpus_tmp, self.corpus_file)
+
+        # Trie (índice invertido) montada de uma vez, um termo por vez
+        print("Construindo a Trie...")
+        self._build_trie()
 
         # Passagem 2: Calcular stats finais (Z-score) e salvar tudo.
-        self._calculate_and_save_stats(raw_stats)
+        self._calculate_and_save_stats()
         print("Módulo de Indexação encerrado.")
 
-    def _calculate_and_save_stats(self, raw_stats):
+    def _build_trie(self):
+        """Agrupa as postings do índice direto por termo e insere cada termo uma única vez na Trie."""
+        doc_ptr = np.array(self.forward_ptr, dtype=np.int64)
+        term_ids = np.frombuffer(self.forward_term_ids, dtype=np.uint32)
+        doc_ids = np.repeat(np.arange(len(doc_ptr) - 1, dtype=np.uint32), np.diff(doc_ptr))
+        
+        # Ordenação estável por term_id: dentro de cada termo os DocIDs seguem crescentes
+        order = np.argsort(term_ids, kind='stable')
+        doc_ids = doc_ids[order]
+        tfs = np.frombuffer(self.forward_tfs, dtype=np.uint32)[order]
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(term_ids, minlength=len(self.term_ids)))))
+        
+        # Termos em ordem alfabética: inserções vizinhas compartilham o caminho na Trie
+        self.trie.bulk_insert(
+            (term, doc_ids[bounds[t]:bounds[t + 1]], tfs[bounds[t]:bounds[t + 1]])
+            for term, t in sorted(self.term_ids.items())
+        )
+
+    def _grow_stats(self, num_terms):
+        """Dobra a capacidade dos arrays de estatísticas até caberem `num_terms` termos."""
+        capacity = len(self.stats_df)
+        if num_terms <= capacity:
+            return
+        while capacity < num_terms:
+            capacity *= 2
+        
+        for name in ('stats_df', 'stats_mean', 'stats_m2'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _update_stats(self, term_ids, tfs):
+        """Acumula nas estatísticas (Welford) os TFs dos termos de um doc."""
+        self._grow_stats(len(self.term_ids))
+        _welford_update(term_ids, tfs, self.stats_df, self.stats_mean, self.stats_m2)
+
+    def _calculate_and_save_stats(self):
         """Calcula Média (mu) e Desvio-Padrão (sigma) e salva tudo em disco."""
         
         num_docs = self.total_docs
         print(f"\nCalculando estatísticas finais para {num_docs} documentos...")
         
-        final_stats = {}
-        for term, data in raw_stats.items():
-            
-            sum_tf = data['sum_tf']
-            sum_tf2 = data['sum_tf2']
-            df = data['df'] # Document Frequency
-            
-            # Média (Mu)
-            mu = sum_tf / df if df > 0 else 0 
-            
-            # Desvio-Padrão (Sigma)
-            variance = (sum_tf2 / df) - (mu ** 2) if df > 0 else 0
-            sigma = math.sqrt(variance) if variance >= 0 else 0
-            
-            final_stats[term] = {
-                'mu': mu,
-                'sigma': sigma,
-                'df': df
-            }
+        # Todos os termos de uma vez: mu já acumulada na Passagem 1, sigma = sqrt(M2 / df)
+        num_terms = len(self.term_ids)
+        df = self.stats_df[:num_terms] # Document Frequency
+        mu = self.stats_mean[:num_terms]
+        sigma = np.sqrt(np.divide(self.stats_m2[:num_terms], df, out=np.zeros(num_terms), where=df > 0))
         
-        self.global_stats = final_stats
+        self.global_stats = {
+            term: {'mu': m, 'sigma': s, 'df': d}
+            for term, m, s, d in zip(self.term_ids, mu.tolist(), sigma.tolist(), df.tolist())
+        }
 
         # --- Salvamento ---
+        # (o manifesto anterior já foi apagado no início da reindexação: se alguma
+        # gravação falhar, a próxima execução reindexa em vez de carregar um índice parcial)
         
-        # 1. Salva a Trie
-        self.trie.save_to_file(self.trie_file)
-        print(f"Índice invertido salvo em: {self.trie_file}")
-        
-        # 2. Salva o Mapeamento
-        with open(self.map_file, 'w', encoding='utf-8') as f:
-            json.dump({str(k): v for k, v in self.doc_map.items()}, f, indent=4)
-        print(f"Mapeamento salvo em: {self.map_file}")
+        # Arquivos independentes, gravados em paralelo. Só as escritas (write) liberam o GIL:
+        # a serialização (JSON, Trie) continua em série, então o ganho é sobrepor a E/S.
+        # As mensagens saem na ordem de sempre, da thread principal
+        saves = [
+            # 1. A Trie
+            ((self.trie.save_to_file, self.trie_file),
+             f"Índice invertido salvo em: {self.trie_file}"),
+            # 2. O Mapeamento
+            ((save_json, self.map_file, self.doc_map),
+             f"Mapeamento salvo em: {self.map_file}"),
+            # 3. Os Títulos
+            ((save_json, self.titles_file, self.doc_titles),
+             f"Títulos salvos em: {self.titles_file}"),
+            # 4. As Estatísticas
+            ((save_json, self.stats_file, self.global_stats),
+             f"Estatísticas Z-score salvas em: {self.stats_file}"),
+            # 5. Os offsets do corpus concatenado (já escrito na Passagem 1)
+            ((np.save, self.offsets_file, np.frombuffer(self.doc_offsets, dtype=np.uint64).reshape(-1, 2)),
+             f"Corpus concatenado salvo em: {self.corpus_file} (offsets em {self.offsets_file})"),
+            # 6. O índice direto, com os term_ids de cada doc em ordem crescente
+            ((self._save_forward_index,),
+             f"Índice direto salvo em: {self.forward_file}"),
+        ]
+        with ThreadPoolExecutor(max_workers=SAVE_WORKERS) as pool:
+            futures = [pool.submit(*call) for call, _ in saves]
+            for future, (_, message) in zip(futures, saves):
+                future.result() # Propaga o erro, se a gravação falhou (e o manifesto não é gravado)
+                print(message)
 
-        # 3. Salva as Estatísticas
-        with open(self.stats_file, 'w', encoding='utf-8') as f:
-            json.dump(self.global_stats, f, indent=4)
-        print(f"Estatísticas Z-score salvas em: {self.stats_file}")
+        # 7. Salva o manifesto, por último: só vale se todo o resto foi gravado
+        save_json(self.manifest_file, {'hash': HASH_NAME, 'files': self.manifest})
+        print(f"Manifesto salvo em: {self.manifest_file}")
+
+    def _save_forward_index(self):
+        """Ordena os pares (term_id, tf) dentro de cada doc e grava o CSR em .npz."""
+        doc_ptr = np.array(self.forward_ptr, dtype=np.uint64)
+        term_ids = np.frombuffer(self.forward_term_ids, dtype=np.uint32)
+        tfs = np.frombuffer(self.forward_tfs, dtype=np.uint32)
+        
+        doc_rows = np.repeat(np.arange(len(doc_ptr) - 1), np.diff(doc_ptr).astype(np.int64))
+        order = np.lexsort((term_ids, doc_rows))
+        
+        terms = np.array(list(self.term_ids), dtype=str)
+        np.savez(self.forward_file, doc_ptr=doc_ptr, term_ids=term_ids[order], tfs=tfs[order], terms=terms)
 
 # --- Execução direta ---
 if __name__ == '__main__':
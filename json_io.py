@@ -0,0 +1,24 @@
+import json
+
+# orjson (opcional) é bem mais rápido que o json padrão para ler e gravar os .json do índice
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def load_json(path):
+    """Lê um arquivo JSON do índice (com orjson, se instalado)."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_json(path, obj):
+    """Grava `obj` em JSON compacto (sem indentação: os arquivos só são lidos pelo programa)."""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, separators=(',', ':'))